@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import argparse
+import concurrent.futures
+import contextlib
 import functools
 import gzip
 import hashlib
@@ -10,15 +12,20 @@ import platform
 import re
 import secrets
 import shutil
+import stat
 import subprocess
 import sys
 import tarfile
 import tempfile
 import urllib.request
 from typing import Callable
+from typing import Generator
+from typing import IO
 from typing import MutableMapping
 from typing import NamedTuple
 from typing import Protocol
+from typing import Sequence
+from typing import Tuple
 
 
 class Version(NamedTuple):
@@ -26,11 +33,14 @@ class Version(NamedTuple):
     minor: int
     patch: int
 
+    # NamedTuple can't hold extra attributes, cache these per value instead
     @property
+    @functools.lru_cache(maxsize=None)
     def py_minor(self) -> str:
         return f'python{self.major}.{self.minor}'
 
     @property
+    @functools.lru_cache(maxsize=None)
     def s(self) -> str:
         return f'{self.major}.{self.minor}.{self.patch}'
 
@@ -83,12 +93,37 @@ def already_built(archive_name: str) -> bool:
         return True
 
 
-def _archive_name(version: Version, build: int, platform: str) -> str:
-    return f'python-{version.s}+{build}-{platform}.tgz'
+ARCHIVE_EXTS = {'gz': '.tgz', 'zst': '.tar.zst'}
+
+
+def _archive_name(
+        version: Version,
+        build: int,
+        platform: str,
+        codec: str = 'gz',
+        *,
+        fast: bool = False,
+) -> str:
+    # `--fast` builds are not release builds, mark them so they're not
+    # mistaken for (or uploaded as) one
+    label = f'{build}.fast' if fast else f'{build}'
+    return f'python-{version.s}+{label}-{platform}{ARCHIVE_EXTS[codec]}'
+
+
+def _check_output(cmd: tuple[str, ...]) -> bytes:
+    # with an absolute executable and no fds to close, subprocess can use
+    # `posix_spawn` rather than `fork` + `exec`
+    return subprocess.check_output(
+        cmd,
+        executable=shutil.which(cmd[0]) or cmd[0],
+        stdin=subprocess.DEVNULL,
+        close_fds=False,
+    )
 
 
 PLAT_MAP = {'x86_64': 'amd64', 'aarch64': 'arm64', 'arm64': 'arm64'}
 IMAGE_NAME = f'ghcr.io/getsentry/prebuilt-pythons-manylinux-{PLAT_MAP[platform.machine()]}-ci'  # noqa: E501
+CCACHE_DIR = '~/.cache/ccache-prebuilt-pythons'
 
 
 def _docker_run() -> tuple[str, ...]:
@@ -103,12 +138,18 @@ def _linux_setup_deps() -> int:
     if os.environ.get('BUILD_BINARY_IN_CONTAINER'):
         return 0
 
+    ccache_dir = os.environ.get('CCACHE_DIR', os.path.expanduser(CCACHE_DIR))
+    os.makedirs(ccache_dir, exist_ok=True)
+
     print('execing into container...')
     cmd = (
         *_docker_run(),
-        '--pull=always',
+        '--pull=missing',
         '--rm',
         '--volume', f'{os.path.abspath("dist")}:/dist:rw',
+        # the container user has no usable home directory
+        '--volume', f'{ccache_dir}:/ccache:rw',
+        '--env', 'CCACHE_DIR=/ccache',
         # TODO: if we target 3.9+: __file__ is an abspath
         '--volume', f'{os.path.abspath(__file__)}:/{os.path.basename(__file__)}',  # noqa: E501
         '--workdir', '/',
@@ -127,46 +168,66 @@ def _linux_modify_env(environ: MutableMapping[str, str]) -> None:
     pass  # no special environ mutation needed on linux
 
 
+LIBC6_SO_LINE = re.compile(rb'^/lib/.*\.so.*$', re.MULTILINE)
+
+
 @functools.lru_cache(maxsize=1)
 def _libc6_links() -> frozenset[str]:
-    out = subprocess.check_output(('dpkg', '-L', 'libc6')).decode()
+    out = _check_output(('dpkg', '-L', 'libc6'))
     return frozenset(
-        line for line in out.splitlines()
-        if line.startswith('/lib/')
-        if '.so' in line
+        match.decode() for match in LIBC6_SO_LINE.findall(out)
     )
 
 
-LDD_LINE = re.compile(r'^[^ ]+ => ([^ ]+) \([^(]+\)$')
+LDD_LINE = re.compile(
+    rb'^(?:'
+    # given multiple files, each file's output is preceded by `filename:`
+    rb'(?P<header>\S.*):|'
+    rb'[ \t]+[^ \n]+ => (?P<path>[^ \n]+) \([^(\n]+\)|'
+    rb'[ \t]+(?:linux-vdso\.so\.1 |/lib/ld-linux-|/lib64/ld-linux-).*|'
+    rb'[ \t]+statically linked|'
+    rb'(?P<unexpected>.+)'
+    rb')$',
+    re.MULTILINE,
+)
 
 
-def _linux_linked(filename: str) -> list[str]:
+def _linux_linked_many(filenames: Sequence[str]) -> dict[str, list[str]]:
     ignored = _libc6_links()
 
-    out = subprocess.check_output(('ldd', filename)).decode()
-    ret = []
-    for line in out.splitlines():
-        line = line.strip()
-        match = LDD_LINE.match(line)
+    out = _check_output(('ldd', *filenames))
 
-        if match is None:
-            if line == 'statically linked':
-                continue
-            elif line.startswith((
-                    'linux-vdso.so.1 ',
-                    '/lib/ld-linux-',
-                    '/lib64/ld-linux-',
-            )):
-                continue
-            else:
-                raise AssertionError(f'unexpected ldd line:\n\n{line}')
-        elif match[1] not in ignored:
-            ret.append(match[1])
+    ret: dict[str, list[str]] = {}
+    # ldd only labels the sections when given more than one file
+    if len(filenames) == 1:
+        deps: list[str] | None = ret.setdefault(filenames[0], [])
+    else:
+        deps = None
+
+    for match in LDD_LINE.finditer(out):
+        if match['header'] is not None:
+            deps = ret.setdefault(match['header'].decode(), [])
+        elif match['unexpected'] is not None or deps is None:
+            line = match[0].decode()
+            raise AssertionError(f'unexpected ldd line:\n\n{line}')
+        elif match['path'] is not None:
+            path = match['path'].decode()
+            if path not in ignored:
+                deps.append(path)
+
+    if list(ret) != list(filenames):
+        raise AssertionError(f'unexpected ldd output:\n\n{out.decode()}')
 
     return ret
 
 
-def _linux_relink(filename: str, libdir: str, *, set_name: bool) -> None:
+def _linux_relink(
+        filename: str,
+        linked: list[str],
+        libdir: str,
+        *,
+        set_name: bool,
+) -> None:
     origin = f'$ORIGIN/{os.path.relpath(libdir, os.path.dirname(filename))}'
     cmd = ('patchelf', '--force-rpath', '--set-rpath', origin, filename)
     subprocess.check_call(cmd)
@@ -193,13 +254,26 @@ def _darwin_setup_deps() -> int:
     if not os.access(_brew(), os.X_OK):
         raise NotImplementedError('setup brew')
 
-    pkgs = ('pkg-config', BREW_SSL, *BREW_LIBS)
-    return subprocess.call((_brew(), 'install', '-q', *pkgs))
+    pkgs = ('ccache', 'pigz', 'pkg-config', 'zstd', BREW_SSL, *BREW_LIBS)
+    if subprocess.call((_brew(), 'install', '-q', *pkgs)):
+        return 1
+
+    # look up every prefix we'll need in a single `brew` invocation
+    _brew_paths('ccache', BREW_SSL, *BREW_LIBS)
+    return 0
+
+
+_BREW_PREFIXES: dict[str, str] = {}
 
 
 def _brew_paths(*pkgs: str) -> list[str]:
-    cmd = (_brew(), '--prefix', *pkgs)
-    return subprocess.check_output(cmd).decode().splitlines()
+    # `brew` is slow to start so only ask about packages we haven't seen
+    missing = [pkg for pkg in dict.fromkeys(pkgs) if pkg not in _BREW_PREFIXES]
+    if missing:
+        cmd = (_brew(), '--prefix', *missing)
+        out = _check_output(cmd).decode().splitlines()
+        _BREW_PREFIXES.update(zip(missing, out))
+    return [_BREW_PREFIXES[pkg] for pkg in pkgs]
 
 
 def _darwin_configure_args() -> tuple[str, ...]:
@@ -221,16 +295,11 @@ def _darwin_modify_env(environ: MutableMapping[str, str]) -> None:
 OTOOL_L_LINE = re.compile(r'\s+(.+) \(compatibility .*, current .*\)$')
 
 
-def _darwin_linked(filename: str) -> list[str]:
-    out = subprocess.check_output(('otool', '-L', filename)).decode()
-    lines = out.splitlines()
-    if lines[0] != f'{filename}:':
-        raise AssertionError(f'unexpected otool output:\n\n{out}')
-
+def _otool_deps(filename: str, lines: list[str]) -> list[str]:
     ret = []
 
-    # every line after this should be linker output
-    for line in lines[1:]:
+    # every line after the header should be linker output
+    for line in lines:
         match = OTOOL_L_LINE.match(line)
         if match is None:
             raise AssertionError(f'unexpected otool output:\n\n{line}')
@@ -246,7 +315,39 @@ def _darwin_linked(filename: str) -> list[str]:
     return ret
 
 
-def _darwin_relink(filename: str, libdir: str, *, set_name: bool) -> None:
+def _otool_sections(out: str) -> dict[str, list[str]]:
+    # each file's output is preceded by `filename:`
+    ret: dict[str, list[str]] = {}
+    section = None
+    for line in out.splitlines():
+        if not line[:1].isspace() and line.endswith(':'):
+            section = ret[line[:-1]] = []
+        elif section is None:
+            raise AssertionError(f'unexpected otool output:\n\n{out}')
+        else:
+            section.append(line)
+    return ret
+
+
+def _darwin_linked_many(filenames: Sequence[str]) -> dict[str, list[str]]:
+    out = _check_output(('otool', '-L', *filenames)).decode()
+    sections = _otool_sections(out)
+    if list(sections) != list(filenames):
+        raise AssertionError(f'unexpected otool output:\n\n{out}')
+
+    return {
+        filename: _otool_deps(filename, lines)
+        for filename, lines in sections.items()
+    }
+
+
+def _darwin_relink(
+        filename: str,
+        linked: list[str],
+        libdir: str,
+        *,
+        set_name: bool,
+) -> None:
     dirname, basename = os.path.split(filename)
     if set_name:
         subprocess.check_call((
@@ -255,7 +356,7 @@ def _darwin_relink(filename: str, libdir: str, *, set_name: bool) -> None:
             filename,
         ))
 
-    for link in _darwin_linked(filename):
+    for link in linked:
         soname = os.path.basename(link)
         libdir_so = os.path.join(libdir, soname)
         new = f'@loader_path/{os.path.relpath(libdir_so, dirname)}'
@@ -278,7 +379,14 @@ def _darwin_platform_name() -> str:
 
 
 class _Relink(Protocol):
-    def __call__(self, filename: str, libdir: str, *, set_name: bool) -> None:
+    def __call__(
+            self,
+            filename: str,
+            linked: list[str],
+            libdir: str,
+            *,
+            set_name: bool,
+    ) -> None:
         ...
 
 
@@ -286,7 +394,7 @@ class Platform(NamedTuple):
     setup_deps: Callable[[], int]
     configure_args: Callable[[], tuple[str, ...]]
     modify_env: Callable[[MutableMapping[str, str]], None]
-    linked: Callable[[str], list[str]]
+    linked_many: Callable[[Sequence[str]], dict[str, list[str]]]
     relink: _Relink
     platform_name: Callable[[], str]
 
@@ -296,7 +404,7 @@ plats = {
         setup_deps=_linux_setup_deps,
         configure_args=_linux_configure_args,
         modify_env=_linux_modify_env,
-        linked=_linux_linked,
+        linked_many=_linux_linked_many,
         relink=_linux_relink,
         platform_name=_linux_platform_name,
     ),
@@ -304,7 +412,7 @@ plats = {
         setup_deps=_darwin_setup_deps,
         configure_args=_darwin_configure_args,
         modify_env=_darwin_modify_env,
-        linked=_darwin_linked,
+        linked_many=_darwin_linked_many,
         relink=_darwin_relink,
         platform_name=_darwin_platform_name,
     ),
@@ -321,17 +429,38 @@ def _sanitize_environ(environ: MutableMapping[str, str]) -> None:
     environ['HOMEBREW_NO_AUTO_UPDATE'] = '1'
 
 
-def _download(py: Python, target: str) -> None:
-    req = urllib.request.urlopen(py.url)
-    with open(target, 'wb') as f:
-        shutil.copyfileobj(req, f)
+READ_SIZE = 256 * 1024
+
+
+def _ccache_compilers_dir() -> str:
+    # ccache's directory of symlinks named after each compiler
+    if sys.platform == 'darwin':
+        ccache_prefix, = _brew_paths('ccache')
+        return os.path.join(ccache_prefix, 'libexec')
+    else:
+        return '/usr/lib/ccache'
+
+
+def _ccache_modify_env(environ: MutableMapping[str, str]) -> None:
+    if not shutil.which('ccache'):
+        return
+
+    # hits come from rebuilding a version (a re-run, a new --build): the
+    # two pgo passes use different flags so they never share entries
+
+    # first on PATH so ccache wraps whichever compiler configure picks
+    compilers_dir = _ccache_compilers_dir()
+    environ['PATH'] = f'{compilers_dir}{os.pathsep}{environ["PATH"]}'
+    environ['CCACHE_COMPILERCHECK'] = 'content'
+    environ.setdefault('CCACHE_DIR', os.path.expanduser(CCACHE_DIR))
 
+
+def _download(py: Python, f: IO[bytes]) -> None:
+    resp = urllib.request.urlopen(py.url)
     checksum = hashlib.sha256()
-    with open(target, 'rb') as f:
-        bts = f.read(4096)
-        while bts:
-            checksum.update(bts)
-            bts = f.read(4096)
+    for bts in iter(lambda: resp.read(READ_SIZE), b''):
+        checksum.update(bts)
+        f.write(bts)
 
     if not secrets.compare_digest(checksum.hexdigest(), py.sha256):
         raise SystemExit(
@@ -341,26 +470,87 @@ def _download(py: Python, target: str) -> None:
         )
 
 
-def _extract_strip_1(tgz: str, target: str) -> None:
-    # `tar --strip-components=1` would be faster
-    # but requires gnu tar (not reliably available on macos)
+def _strip_1(tarf: tarfile.TarFile) -> Generator[tarfile.TarInfo, None, None]:
+    for member in tarf:
+        _, _, member.path = member.path.partition('/')
+        yield member
+
+
+@functools.lru_cache(maxsize=1)
+def _gnu_tar() -> bool:
+    out = _check_output(('tar', '--version'))
+    return out.startswith(b'tar (GNU tar)')
+
+
+def _extract_strip_1(fileobj: IO[bytes], target: str) -> None:
     os.makedirs(target, exist_ok=True)
-    with tarfile.open(tgz) as tarf:
-        members = []
-        for member in tarf.getmembers():
-            _, _, member.path = member.path.partition('/')
-            members.append(member)
-        tarf.extractall(target, members=members)
+
+    # piping through `xz` overlaps decompression with extraction (`-T0`
+    # only decodes in parallel with xz >= 5.4, buster ships 5.2) and
+    # `tar --strip-components=1` requires gnu tar (not reliably on macos)
+    if shutil.which('xz') and _gnu_tar():
+        xz = subprocess.Popen(
+            ('xz', '-T0', '-dc'),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        assert xz.stdin is not None and xz.stdout is not None
+        tar = subprocess.Popen(
+            ('tar', '-x', '--strip-components=1', '-C', target, '-f', '-'),
+            stdin=xz.stdout,
+        )
+        xz.stdout.close()  # so xz sees SIGPIPE if tar exits early
+        try:
+            with xz.stdin:
+                shutil.copyfileobj(fileobj, xz.stdin, READ_SIZE)
+        except BrokenPipeError:
+            pass  # tar (and then xz) exited early: report that below
+
+        for proc in (xz, tar):
+            proc.wait()
+        # tar first: its failure is the cause when xz dies of SIGPIPE
+        for proc in (tar, xz):
+            if proc.returncode:
+                raise subprocess.CalledProcessError(proc.returncode, proc.args)
+    else:
+        # not `r|xz`: the streaming reader is quadratic on compressed input
+        with tarfile.open(fileobj=fileobj, mode='r:xz') as tarf:
+            tarf.extractall(target, members=_strip_1(tarf))
+
+
+def _download_and_extract(py: Python, target: str) -> None:
+    # not SpooledTemporaryFile: before 3.11 it is not `seekable()`, which
+    # tarfile's `r:xz` needs
+    with tempfile.TemporaryFile() as f:
+        _download(py, f)
+        f.seek(0)
+        _extract_strip_1(f, target)
+
+
+def _optimization_args(version: Version, *, fast: bool) -> tuple[str, ...]:
+    if not fast:
+        return ('--enable-optimizations', '--with-lto')
+    # skip the pgo training run -- only 3.11+ can pick the lto flavor, thin
+    # lto needs clang (macos) whereas gcc (linux) only does full lto
+    elif sys.platform == 'darwin' and version >= (3, 11):
+        return ('--with-lto=thin',)
+    else:
+        return ('--with-lto',)
 
 
-def _build(build_dir: str, prefix: str) -> int:
+def _build(
+        build_dir: str,
+        prefix: str,
+        version: Version,
+        *,
+        fast: bool,
+) -> int:
     if subprocess.call(
         (
             './configure',
             '--prefix', prefix,
             '--without-ensurepip',
-            '--enable-optimizations',
-            '--with-lto',
+            *_optimization_args(version, fast=fast),
             *plat.configure_args(),
         ),
         cwd=build_dir,
@@ -377,6 +567,15 @@ def _build(build_dir: str, prefix: str) -> int:
     return 0
 
 
+def _rm_pyc(path: str) -> None:
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                _rm_pyc(entry.path)
+            elif entry.name.endswith('.pyc'):
+                os.unlink(entry.path)
+
+
 def _clean(prefix: str, version: Version) -> None:
     # maybe look at --disable-test-modules for 3.10+
     for mod_path in (
@@ -396,37 +595,70 @@ def _clean(prefix: str, version: Version) -> None:
         )
 
     # don't bundle pyc files, they'll all be invalidated after install
-    subprocess.check_call(('find', prefix, '-name', '*.pyc', '-delete'))
+    # `make install` only byte-compiles the stdlib: split it up by package
+    stdlib = os.path.join(prefix, 'lib', version.py_minor)
+    with os.scandir(stdlib) as entries:
+        dirs = [e.path for e in entries if e.is_dir(follow_symlinks=False)]
+    workers = multiprocessing.cpu_count()
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        for _ in executor.map(_rm_pyc, dirs):
+            pass  # re-raise any failures
 
     # TODO: there's a few other potential savings as well:
     # - symlink libpython.a (there's 2 copies)
     # - remove some unused modules / data (pydoc, lib2to3)
 
 
-def _relink_1(filename: str, libdir: str, *, set_name: bool = False) -> None:
-    linked = plat.linked(filename)
-    plat.relink(filename, libdir, set_name=set_name)
-    # relink breadth first
-    to_link = []
-    for link in linked:
-        soname = os.path.basename(link)
-        libdir_so = os.path.join(libdir, soname)
-        if not os.path.exists(libdir_so):
-            shutil.copy(link, libdir)
-            to_link.append(libdir_so)
+def _relink_all(filenames: list[str], libdir: str) -> None:
+    set_name = False
+
+    # the relinking tools are subprocesses so threads are enough
+    workers = multiprocessing.cpu_count()
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        # relink breadth first, a level of dependencies at a time
+        while filenames:
+            # one `ldd` / `otool -L` for the whole level
+            linked = plat.linked_many(filenames)
+
+            to_link = []
+            for filename in filenames:
+                for link in linked[filename]:
+                    soname = os.path.basename(link)
+                    libdir_so = os.path.join(libdir, soname)
+                    # already copied (at this level or an earlier one)
+                    if os.path.exists(libdir_so):
+                        continue
+                    shutil.copy(link, libdir)
+                    to_link.append(libdir_so)
+
+            futures = [
+                executor.submit(
+                    plat.relink,
+                    filename,
+                    linked[filename],
+                    libdir,
+                    set_name=set_name,
+                )
+                for filename in filenames
+            ]
+            for future in futures:
+                future.result()  # re-raise any failures
 
-    for libdir_so in to_link:
-        _relink_1(libdir_so, libdir, set_name=True)
+            filenames = to_link
+            set_name = True
 
 
 def _relink(prefix: str, version: Version) -> None:
     libdir = os.path.join(prefix, 'lib')
-
-    _relink_1(os.path.join(prefix, 'bin', version.py_minor), libdir)
-
     dyn_dir = os.path.join(prefix, 'lib', version.py_minor, 'lib-dynload')
-    for so in os.listdir(dyn_dir):
-        _relink_1(os.path.join(dyn_dir, so), libdir)
+
+    _relink_all(
+        [
+            os.path.join(prefix, 'bin', version.py_minor),
+            *(os.path.join(dyn_dir, so) for so in sorted(os.listdir(dyn_dir))),
+        ],
+        libdir,
+    )
 
 
 def _reset_tarinfo(tarinfo: tarfile.TarInfo) -> tarfile.TarInfo:
@@ -436,32 +668,131 @@ def _reset_tarinfo(tarinfo: tarfile.TarInfo) -> tarfile.TarInfo:
     return tarinfo
 
 
-def _archive(src: str, dest: str) -> None:
-    name, _ = os.path.splitext(os.path.basename(dest))
-    arcs = [(name, src)]
-    for root, dirs, filenames in os.walk(src):
-        for filename in dirs + filenames:
-            abspath = os.path.abspath(os.path.join(root, filename))
-            relpath = os.path.relpath(abspath, src)
-            arcs.append((os.path.join(name, relpath), abspath))
+@contextlib.contextmanager
+def _compressed_open(
+        dest: str,
+        codec: str,
+) -> Generator[IO[bytes], None, None]:
+    if codec == 'zst':
+        # --long: a larger match window pays off on a ~100MB tarball
+        cmd: tuple[str, ...] = ('zstd', '-q', '-T0', '-19', '--long=27')
+    elif shutil.which('pigz'):
+        # pigz compresses on all cores
+        cmd = ('pigz', '--no-name', '-9')
+    else:
+        with gzip.GzipFile(dest, 'wb', mtime=0) as gzipf:
+            yield gzipf  # type: ignore
+        return
+
+    with open(dest, 'wb') as f:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=f)
+    assert proc.stdin is not None
+    with proc.stdin:
+        yield proc.stdin
+    if proc.wait():
+        raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+
+ArchiveEntry = Tuple[str, str, os.stat_result]
+
+
+def _scandir(src: str, arcname: str, ret: list[ArchiveEntry]) -> None:
+    with os.scandir(src) as entries:
+        for entry in entries:
+            entry_arcname = f'{arcname}/{entry.name}'
+            st = entry.stat(follow_symlinks=False)
+            ret.append((entry_arcname, entry.path, st))
+            if stat.S_ISDIR(st.st_mode):
+                _scandir(entry.path, entry_arcname, ret)
+
+
+def _tarinfo(
+        arcname: str,
+        path: str,
+        st: os.stat_result,
+        inodes: dict[tuple[int, int], str],
+) -> tarfile.TarInfo:
+    # like `TarFile.gettarinfo` but reusing the stat from the directory scan
+    # and skipping the owner lookups as `_reset_tarinfo` replaces them anyway
+    tarinfo = tarfile.TarInfo(arcname)
+    tarinfo.mode = stat.S_IMODE(st.st_mode)
+    if stat.S_ISREG(st.st_mode):
+        inode = (st.st_ino, st.st_dev)
+        if st.st_nlink > 1 and inode in inodes:
+            tarinfo.type = tarfile.LNKTYPE
+            tarinfo.linkname = inodes[inode]
+        else:
+            inodes[inode] = arcname
+            tarinfo.size = st.st_size
+    elif stat.S_ISDIR(st.st_mode):
+        tarinfo.type = tarfile.DIRTYPE
+    elif stat.S_ISLNK(st.st_mode):
+        tarinfo.type = tarfile.SYMTYPE
+        tarinfo.linkname = os.readlink(path)
+    else:
+        raise AssertionError(f'unexpected file type: {path}')
+    return _reset_tarinfo(tarinfo)
+
+
+class _Tee:
+    def __init__(self, files: Sequence[IO[bytes]]) -> None:
+        self.files = files
+
+    def write(self, bts: bytes) -> int:
+        for f in self.files:
+            f.write(bts)
+        return len(bts)
+
+
+def _archive(src: str, dests: dict[str, str]) -> None:
+    # one tar stream, compressed by each codec at once
+    name, = {
+        os.path.basename(dest)[:-len(ARCHIVE_EXTS[codec])]
+        for codec, dest in dests.items()
+    }
+    arcs = [(name, src, os.lstat(src))]
+    _scandir(src, name, arcs)
     arcs.sort()
 
-    with gzip.GzipFile(dest, 'wb', mtime=0) as gzipf:
+    inodes: dict[tuple[int, int], str] = {}
+    with contextlib.ExitStack() as ctx:
+        out = _Tee([
+            ctx.enter_context(_compressed_open(dest, codec))
+            for codec, dest in dests.items()
+        ])
         # https://github.com/python/typeshed/issues/5491
-        with tarfile.open(fileobj=gzipf, mode='w') as tf:  # type: ignore
-            for arcname, abspath in arcs:
-                tf.add(
-                    abspath,
-                    arcname=arcname,
-                    recursive=False,
-                    filter=_reset_tarinfo,
-                )
+        with tarfile.open(fileobj=out, mode='w|') as tf:  # type: ignore
+            for arcname, path, st in arcs:
+                tarinfo = _tarinfo(arcname, path, st, inodes)
+                if tarinfo.isreg():
+                    with open(path, 'rb') as f:
+                        tf.addfile(tarinfo, f)
+                else:
+                    tf.addfile(tarinfo)
+
+
+def _archive_names(
+        version: Version,
+        build: int,
+        *,
+        fast: bool,
+) -> dict[str, str]:
+    platform_name = plat.platform_name()
+    return {
+        codec: _archive_name(version, build, platform_name, codec, fast=fast)
+        for codec in ARCHIVE_EXTS
+    }
 
 
 def main() -> int:
     parser = argparse.ArgumentParser()
     parser.add_argument('version')
     parser.add_argument('--build', type=int, default=0)
+    parser.add_argument(
+        '--fast',
+        action='store_true',
+        help='skip pgo for quicker (non-release!) builds',
+    )
     args = parser.parse_args()
 
     version = Version.parse(args.version)
@@ -469,26 +800,34 @@ def main() -> int:
 
     os.makedirs('dist', exist_ok=True)
     _sanitize_environ(os.environ)
+
+    # check before setting up dependencies so there's nothing to install
+    # when the build exists -- on linux the platform name comes from the
+    # container's libc so the check happens once we've exec'd into it
+    if sys.platform != 'linux' or os.environ.get('BUILD_BINARY_IN_CONTAINER'):
+        names = _archive_names(version, args.build, fast=args.fast)
+        if all(already_built(name) for name in names.values()):
+            print('already built!')
+            return 0
+
     plat.setup_deps()
     plat.modify_env(os.environ)
+    _ccache_modify_env(os.environ)
 
-    archive_name = _archive_name(version, args.build, plat.platform_name())
-    if already_built(archive_name):
-        print('already built!')
-        return 0
+    # fail now rather than after the (long) build
+    if not shutil.which('zstd'):
+        raise SystemExit('zstd is required (to write the .tar.zst archive)')
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        print('downloading...')
-        tgz = os.path.join(tmpdir, 'python.tgz')
-        _download(python, tgz)
+    archive_names = _archive_names(version, args.build, fast=args.fast)
 
-        print('extracting...')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        print('downloading and extracting...')
         build_dir = os.path.join(tmpdir, 'build')
-        _extract_strip_1(tgz, build_dir)
+        _download_and_extract(python, build_dir)
 
         print('building...')
         prefix = os.path.join(tmpdir, 'prefix')
-        if _build(build_dir, prefix):
+        if _build(build_dir, prefix, version, fast=args.fast):
             return 1
 
         print('cleaning...')
@@ -498,9 +837,13 @@ def main() -> int:
         _relink(prefix, version)
 
         print('archiving...')
-        archive = os.path.join(tmpdir, archive_name)
-        _archive(prefix, archive)
-        shutil.move(archive, 'dist')
+        archives = {
+            codec: os.path.join(tmpdir, archive_name)
+            for codec, archive_name in archive_names.items()
+        }
+        _archive(prefix, archives)
+        for archive in archives.values():
+            shutil.move(archive, 'dist')
 
     return 0
 
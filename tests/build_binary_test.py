@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 import email.message
+import hashlib
 import http
 import io
+import lzma
 import os.path
 import platform
 import shutil
 import subprocess
 import sys
+import tarfile
 import urllib.error
 import urllib.request
 from unittest import mock
@@ -30,6 +33,12 @@ def test_version_s():
     assert Version(3, 10, 1).s == '3.10.1'
 
 
+def test_version_properties_cached():
+    version = Version(3, 10, 1)
+    assert version.py_minor is Version(3, 10, 1).py_minor
+    assert version.s is Version(3, 10, 1).s
+
+
 def test_already_built_404():
     error = urllib.error.HTTPError(
         'https://example.com',
@@ -70,6 +79,43 @@ def test_archive_name():
     assert archive == 'python-3.9.11+2-macosx_10_15_x86_64.tgz'
 
 
+def test_check_output():
+    assert build_binary._check_output(('echo', 'hello')) == b'hello\n'
+
+
+def test_check_output_error():
+    with pytest.raises(subprocess.CalledProcessError):
+        build_binary._check_output(('false',))
+
+
+def test_archive_name_zst():
+    version = Version(3, 9, 11)
+    archive = build_binary._archive_name(
+        version, 2, 'macosx_10_15_x86_64', 'zst',
+    )
+    assert archive == 'python-3.9.11+2-macosx_10_15_x86_64.tar.zst'
+
+
+def test_archive_name_fast():
+    version = Version(3, 9, 11)
+    archive = build_binary._archive_name(
+        version, 2, 'macosx_10_15_x86_64', fast=True,
+    )
+    assert archive == 'python-3.9.11+2.fast-macosx_10_15_x86_64.tgz'
+
+
+def test_archive_names():
+    version = Version(3, 9, 11)
+    platform_name = mock.Mock(return_value='macosx_10_15_x86_64')
+    plat = build_binary.plat._replace(platform_name=platform_name)
+    with mock.patch.object(build_binary, 'plat', plat):
+        names = build_binary._archive_names(version, 2, fast=False)
+    assert names == {
+        'gz': 'python-3.9.11+2-macosx_10_15_x86_64.tgz',
+        'zst': 'python-3.9.11+2-macosx_10_15_x86_64.tar.zst',
+    }
+
+
 def test_docker_run_podman():
     with mock.patch.object(shutil, 'which', return_value='/usr/bin/podman'):
         assert build_binary._docker_run() == ('podman', 'run')
@@ -139,18 +185,62 @@ def test_linux_linked_unit(patched_libc6_links):
 \t/lib64/ld-linux-aarch64.so.1 (0x0000ffff9f2ed000)
 '''
     with mock.patch.object(subprocess, 'check_output', return_value=out):
-        ret = build_binary._linux_linked('/some/file.so')
-    assert ret == [
-        '/lib/aarch64-linux-gnu/libexpat.so.1',
-        '/lib/aarch64-linux-gnu/libz.so.1',
-    ]
+        ret = build_binary._linux_linked_many(('/some/file.so',))
+    assert ret == {
+        '/some/file.so': [
+            '/lib/aarch64-linux-gnu/libexpat.so.1',
+            '/lib/aarch64-linux-gnu/libz.so.1',
+        ],
+    }
 
 
 def test_linux_linked_unit_static_linked(patched_libc6_links):
     out = b'\tstatically linked\n'
     with mock.patch.object(subprocess, 'check_output', return_value=out):
-        ret = build_binary._linux_linked('/some/file.so')
-    assert ret == []
+        ret = build_binary._linux_linked_many(('/some/file.so',))
+    assert ret == {'/some/file.so': []}
+
+
+def test_linux_linked_unit_not_found(patched_libc6_links):
+    out = b'''\
+\tlinux-vdso.so.1 (0x0000ffff9f326000)
+\tlibz.so.1 => not found
+'''
+    with mock.patch.object(subprocess, 'check_output', return_value=out):
+        with pytest.raises(AssertionError) as excinfo:
+            build_binary._linux_linked_many(('/some/file.so',))
+    msg, = excinfo.value.args
+    assert msg == 'unexpected ldd line:\n\n\tlibz.so.1 => not found'
+
+
+def test_linux_linked_many_unit(patched_libc6_links):
+    out = b'''\
+/some/file.so:
+\tlinux-vdso.so.1 (0x0000ffff9f326000)
+\tlibz.so.1 => /lib/aarch64-linux-gnu/libz.so.1 (0x0000ffff9ec00000)
+\tlibc.so.6 => /lib/aarch64-linux-gnu/libc.so.6 (0x0000ffff9ea50000)
+\t/lib/ld-linux-aarch64.so.1 (0x0000ffff9f2ed000)
+/some/other.so:
+\tlinux-vdso.so.1 (0x0000ffff9f326000)
+\tlibssl.so.1.1 => /lib/aarch64-linux-gnu/libssl.so.1.1 (0x0000ffff9ec00000)
+\tlibc.so.6 => /lib/aarch64-linux-gnu/libc.so.6 (0x0000ffff9ea50000)
+\t/lib/ld-linux-aarch64.so.1 (0x0000ffff9f2ed000)
+'''
+    filenames = ('/some/file.so', '/some/other.so')
+    with mock.patch.object(subprocess, 'check_output', return_value=out):
+        ret = build_binary._linux_linked_many(filenames)
+    assert ret == {
+        '/some/file.so': ['/lib/aarch64-linux-gnu/libz.so.1'],
+        '/some/other.so': ['/lib/aarch64-linux-gnu/libssl.so.1.1'],
+    }
+
+
+def test_linux_linked_many_unexpected_output(patched_libc6_links):
+    out = b'\tlibz.so.1 => /lib/aarch64-linux-gnu/libz.so.1 (0x0000ffff9ec00000)\n'  # noqa: E501
+    filenames = ('/some/file.so', '/some/other.so')
+    with mock.patch.object(subprocess, 'check_output', return_value=out):
+        with pytest.raises(AssertionError):
+            build_binary._linux_linked_many(filenames)
 
 
 def test_linux_platform_name():
@@ -162,7 +252,13 @@ def test_linux_platform_name():
     assert ret == 'manylinux_2_35_x86_64'
 
 
-def test_brew_paths():
+@pytest.fixture
+def empty_brew_prefixes():
+    with mock.patch.dict(build_binary._BREW_PREFIXES, clear=True):
+        yield
+
+
+def test_brew_paths(empty_brew_prefixes):
     out = b'''\
 /opt/homebrew/opt/openssl@1.1
 /opt/homebrew/opt/xz
@@ -172,6 +268,29 @@ def test_brew_paths():
     assert ret == ['/opt/homebrew/opt/openssl@1.1', '/opt/homebrew/opt/xz']
 
 
+def test_brew_paths_cached(empty_brew_prefixes):
+    out = b'''\
+/opt/homebrew/opt/openssl@1.1
+/opt/homebrew/opt/xz
+'''
+    with mock.patch.object(subprocess, 'check_output', return_value=out):
+        build_binary._brew_paths('openssl@1.1', 'xz')
+
+    out = b'/opt/homebrew/opt/sqlite\n'
+    with mock.patch.object(
+            subprocess, 'check_output', return_value=out,
+    ) as check_output:
+        ret = build_binary._brew_paths('xz', 'sqlite', 'openssl@1.1')
+
+    assert ret == [
+        '/opt/homebrew/opt/xz',
+        '/opt/homebrew/opt/sqlite',
+        '/opt/homebrew/opt/openssl@1.1',
+    ]
+    (cmd,), _ = check_output.call_args
+    assert cmd[1:] == ('--prefix', 'sqlite')
+
+
 @pytest.fixture
 def fake_brew_paths():
     def _brew_paths(*pkgs: str) -> list[str]:
@@ -225,9 +344,9 @@ def test_darwin_linked_unit(tmp_path, openssl_dir):
 \t/usr/lib/libSystem.B.dylib (compatibility version 1.0.0, current version 1311.100.3)
 '''.encode()  # noqa: E501
     with mock.patch.object(subprocess, 'check_output', return_value=out):
-        ret = build_binary._darwin_linked(str(so))
+        ret = build_binary._darwin_linked_many((str(so),))
 
-    assert ret == [libssl, libcrypto]
+    assert ret == {str(so): [libssl, libcrypto]}
 
 
 def test_darwin_linked_unit_self_linked(tmp_path, openssl_dir):
@@ -241,9 +360,27 @@ def test_darwin_linked_unit_self_linked(tmp_path, openssl_dir):
 \t/usr/lib/libSystem.B.dylib (compatibility version 1.0.0, current version 1311.100.3)
 '''.encode()  # noqa: E501
     with mock.patch.object(subprocess, 'check_output', return_value=out):
-        ret = build_binary._darwin_linked(libssl)
+        ret = build_binary._darwin_linked_many((libssl,))
+
+    assert ret == {libssl: [libcrypto]}
+
+
+def test_darwin_linked_many_unit(tmp_path, openssl_dir):
+    libssl, libcrypto = openssl_dir
+
+    out = f'''\
+{libssl}:
+\t{libssl} (compatibility version 1.1.0, current version 1.1.0)
+\t{libcrypto} (compatibility version 1.1.0, current version 1.1.0)
+\t/usr/lib/libSystem.B.dylib (compatibility version 1.0.0, current version 1311.100.3)
+{libcrypto}:
+\t{libcrypto} (compatibility version 1.1.0, current version 1.1.0)
+\t/usr/lib/libSystem.B.dylib (compatibility version 1.0.0, current version 1311.100.3)
+'''.encode()  # noqa: E501
+    with mock.patch.object(subprocess, 'check_output', return_value=out):
+        ret = build_binary._darwin_linked_many((libssl, libcrypto))
 
-    assert ret == [libcrypto]
+    assert ret == {libssl: [libcrypto], libcrypto: []}
 
 
 def test_darwin_platform_name():
@@ -291,20 +428,255 @@ def test_sanitize_environ():
     }
 
 
-def test_extract_strip_1(tmp_path):
+def test_gnu_tar():
+    out = b"""\
+tar (GNU tar) 1.34
+Copyright (C) 2021 Free Software Foundation, Inc.
+"""
+    with mock.patch.object(subprocess, 'check_output', return_value=out):
+        assert build_binary._gnu_tar.__wrapped__() is True
+
+
+def test_gnu_tar_bsdtar():
+    out = b'bsdtar 3.5.1 - libarchive 3.5.1 zlib/1.2.11 liblzma/5.0.5\n'
+    with mock.patch.object(subprocess, 'check_output', return_value=out):
+        assert build_binary._gnu_tar.__wrapped__() is False
+
+
+def test_ccache_modify_env_no_ccache():
+    env = {'SOME': 'VARIABLE'}
+    with mock.patch.object(shutil, 'which', return_value=None):
+        build_binary._ccache_modify_env(env)
+    assert env == {'SOME': 'VARIABLE'}
+
+
+def test_ccache_modify_env():
+    env = {'PATH': '/usr/bin', 'CCACHE_DIR': '/tmp/ccache'}
+    with mock.patch.object(shutil, 'which', return_value='/usr/bin/ccache'):
+        with mock.patch.object(sys, 'platform', 'linux'):
+            build_binary._ccache_modify_env(env)
+    assert env == {
+        'PATH': f'/usr/lib/ccache{os.pathsep}/usr/bin',
+        'CCACHE_COMPILERCHECK': 'content',
+        'CCACHE_DIR': '/tmp/ccache',
+    }
+
+
+def test_ccache_modify_env_darwin(empty_brew_prefixes):
+    env = {'PATH': '/usr/bin', 'HOME': '/Users/asottile'}
+    out = b'/opt/homebrew/opt/ccache\n'
+    with mock.patch.object(shutil, 'which', return_value='/usr/bin/ccache'):
+        with mock.patch.object(sys, 'platform', 'darwin'):
+            with mock.patch.object(
+                    subprocess, 'check_output', return_value=out,
+            ):
+                with mock.patch.dict(os.environ, {'HOME': '/Users/asottile'}):
+                    build_binary._ccache_modify_env(env)
+    assert env == {
+        'PATH': f'/opt/homebrew/opt/ccache/libexec{os.pathsep}/usr/bin',
+        'HOME': '/Users/asottile',
+        'CCACHE_COMPILERCHECK': 'content',
+        'CCACHE_DIR': '/Users/asottile/.cache/ccache-prebuilt-pythons',
+    }
+
+
+@pytest.fixture
+def python_tar_xz(tmp_path):
+    src = tmp_path.joinpath('src')
+    src.mkdir()
+    src.joinpath('root-file').write_text('hello world\n')
+
+    tar_xz = tmp_path.joinpath('Python-3.10.1.tar.xz')
+    with tarfile.open(tar_xz, 'w:xz') as tarf:
+        tarf.add(src, arcname='Python-3.10.1')
+
+    sha256 = hashlib.sha256(tar_xz.read_bytes()).hexdigest()
+    return build_binary.Python(url=tar_xz.as_uri(), sha256=sha256)
+
+
+def test_download_and_extract(tmp_path, python_tar_xz):
+    target = tmp_path.joinpath('build')
+
+    build_binary._download_and_extract(python_tar_xz, str(target))
+
+    assert target.joinpath('root-file').read_text() == 'hello world\n'
+
+
+def test_download_and_extract_without_gnu_tar(tmp_path, python_tar_xz):
+    target = tmp_path.joinpath('build')
+
+    with mock.patch.object(build_binary, '_gnu_tar', return_value=False):
+        build_binary._download_and_extract(python_tar_xz, str(target))
+
+    assert target.joinpath('root-file').read_text() == 'hello world\n'
+
+
+def test_extract_strip_1_tar_exits_early(tmp_path):
+    bin_dir = tmp_path.joinpath('bin')
+    bin_dir.mkdir()
+    tar = bin_dir.joinpath('tar')
+    tar.write_text('#!/bin/sh\nexit 2\n')
+    tar.chmod(0o755)
+
+    # incompressible, so it is larger than the pipe buffers
+    fileobj = io.BytesIO(lzma.compress(os.urandom(4 << 20)))
+
+    path = f'{bin_dir}{os.pathsep}{os.environ["PATH"]}'
+    with mock.patch.dict(os.environ, {'PATH': path}):
+        with mock.patch.object(build_binary, '_gnu_tar', return_value=True):
+            with pytest.raises(subprocess.CalledProcessError) as excinfo:
+                build_binary._extract_strip_1(fileobj, str(tmp_path / 'b'))
+
+    assert excinfo.value.cmd[0] == 'tar'
+    assert excinfo.value.returncode == 2
+
+
+def test_download_and_extract_checksum_mismatch(tmp_path, python_tar_xz):
+    target = tmp_path.joinpath('build')
+    py = python_tar_xz._replace(sha256='0' * 64)
+
+    with pytest.raises(SystemExit) as excinfo:
+        build_binary._download_and_extract(py, str(target))
+
+    msg, = excinfo.value.args
+    assert msg.startswith('checksum mismatch:\n')
+    assert not target.exists()
+
+
+def test_archive(tmp_path):
     in_dir = tmp_path.joinpath('in_dir')
-    in_dir.mkdir()
+    in_dir.joinpath('bin').mkdir(parents=True)
+    in_dir.joinpath('bin', 'python3').touch()
     in_dir.joinpath('root-file').touch()
 
-    tgz = tmp_path.joinpath('out.tgz')
+    tgz = tmp_path.joinpath('python-3.10.1+0-linux.tgz')
+
+    build_binary._archive(str(in_dir), {'gz': str(tgz)})
 
-    build_binary._archive(str(in_dir), str(tgz))
+    with tarfile.open(tgz) as tarf:
+        members = tarf.getmembers()
+    assert [member.name for member in members] == [
+        'python-3.10.1+0-linux',
+        'python-3.10.1+0-linux/bin',
+        'python-3.10.1+0-linux/bin/python3',
+        'python-3.10.1+0-linux/root-file',
+    ]
+    assert {(m.uid, m.gid, m.uname, m.gname, m.mtime) for m in members} == {
+        (0, 0, 'root', 'root', 0),
+    }
+
+
+def test_archive_links(tmp_path):
+    in_dir = tmp_path.joinpath('in_dir')
+    in_dir.joinpath('bin').mkdir(parents=True)
+    in_dir.joinpath('bin', 'python3.10').write_text('python\n')
+    in_dir.joinpath('bin', 'python3').symlink_to('python3.10')
+    os.link(in_dir.joinpath('bin', 'python3.10'), in_dir.joinpath('python'))
+
+    tgz = tmp_path.joinpath('python-3.10.1+0-linux.tgz')
 
-    assert tgz.is_file()
+    build_binary._archive(str(in_dir), {'gz': str(tgz)})
+
+    with tarfile.open(tgz) as tarf:
+        symlink = tarf.getmember('python-3.10.1+0-linux/bin/python3')
+        hardlink = tarf.getmember('python-3.10.1+0-linux/python')
+    assert symlink.issym()
+    assert symlink.linkname == 'python3.10'
+    assert hardlink.islnk()
+    assert hardlink.linkname == 'python-3.10.1+0-linux/bin/python3.10'
+
+
+def test_archive_pigz(tmp_path):
+    # pigz's interface is gzip's so we can stand it in
+    bin_dir = tmp_path.joinpath('bin')
+    bin_dir.mkdir()
+    pigz = bin_dir.joinpath('pigz')
+    pigz.write_text('#!/bin/sh\nexec gzip "$@"\n')
+    pigz.chmod(0o755)
+
+    in_dir = tmp_path.joinpath('in_dir')
+    in_dir.mkdir()
+    in_dir.joinpath('root-file').write_text('hello world\n')
 
-    build_binary._extract_strip_1(str(tgz), str(tmp_path))
+    tgz = tmp_path.joinpath('python-3.10.1+0-linux.tgz')
 
-    assert tmp_path.joinpath('root-file').is_file()
+    path = f'{bin_dir}{os.pathsep}{os.environ["PATH"]}'
+    with mock.patch.dict(os.environ, {'PATH': path}):
+        build_binary._archive(str(in_dir), {'gz': str(tgz)})
+
+    with tarfile.open(tgz) as tarf:
+        member = tarf.extractfile('python-3.10.1+0-linux/root-file')
+        assert member is not None
+        assert member.read() == b'hello world\n'
+
+
+def test_optimization_args():
+    ret = build_binary._optimization_args(Version(3, 11, 3), fast=False)
+    assert ret == ('--enable-optimizations', '--with-lto')
+
+
+def test_optimization_args_fast_linux():
+    with mock.patch.object(sys, 'platform', 'linux'):
+        ret = build_binary._optimization_args(Version(3, 11, 3), fast=True)
+    assert ret == ('--with-lto',)
+
+
+def test_optimization_args_fast_darwin():
+    with mock.patch.object(sys, 'platform', 'darwin'):
+        ret = build_binary._optimization_args(Version(3, 11, 3), fast=True)
+    assert ret == ('--with-lto=thin',)
+
+
+def test_optimization_args_fast_darwin_old_python():
+    with mock.patch.object(sys, 'platform', 'darwin'):
+        ret = build_binary._optimization_args(Version(3, 10, 11), fast=True)
+    assert ret == ('--with-lto',)
+
+
+def test_archive_zst(tmp_path):
+    in_dir = tmp_path.joinpath('in_dir')
+    in_dir.mkdir()
+    in_dir.joinpath('root-file').write_text('hello world\n')
+
+    tar_zst = tmp_path.joinpath('python-3.10.1+0-linux.tar.zst')
+
+    build_binary._archive(str(in_dir), {'zst': str(tar_zst)})
+
+    tar = subprocess.check_output(('zstd', '-dc', tar_zst))
+    with tarfile.open(fileobj=io.BytesIO(tar)) as tarf:
+        assert tarf.getnames() == [
+            'python-3.10.1+0-linux',
+            'python-3.10.1+0-linux/root-file',
+        ]
+
+
+def test_archive_both_codecs(tmp_path):
+    in_dir = tmp_path.joinpath('in_dir')
+    in_dir.mkdir()
+    in_dir.joinpath('root-file').write_text('hello world\n')
+
+    tgz = tmp_path.joinpath('python-3.10.1+0-linux.tgz')
+    tar_zst = tmp_path.joinpath('python-3.10.1+0-linux.tar.zst')
+
+    build_binary._archive(str(in_dir), {'gz': str(tgz), 'zst': str(tar_zst)})
+
+    # the same tar stream went to both compressors
+    tar_from_gz = subprocess.check_output(('gzip', '-dc', tgz))
+    tar_from_zst = subprocess.check_output(('zstd', '-dc', tar_zst))
+    assert tar_from_gz == tar_from_zst
+
+
+def test_rm_pyc(tmp_path):
+    pycache = tmp_path.joinpath('json', '__pycache__')
+    pycache.mkdir(parents=True)
+    pycache.joinpath('decoder.cpython-310.pyc').touch()
+    tmp_path.joinpath('json', 'decoder.py').touch()
+
+    build_binary._rm_pyc(str(tmp_path))
+
+    assert pycache.is_dir()
+    assert not pycache.joinpath('decoder.cpython-310.pyc').exists()
+    assert tmp_path.joinpath('json', 'decoder.py').exists()
 
 
 def test_relink_integration(tmp_path):
@@ -367,9 +739,10 @@ int main(void) {
         # make sure we built correctly
         assert subprocess.check_output(main) == b'hello from 9001\n'
 
-        assert build_binary.plat.linked(str(main)) == [str(libmylib)]
+        linked = build_binary.plat.linked_many((str(main),))
+        assert linked == {str(main): [str(libmylib)]}
 
-        build_binary._relink_1(str(main), str(prefix_lib))
+        build_binary._relink_all([str(main)], str(prefix_lib))
 
     assert prefix_lib.joinpath(f'libmylib.{shared_suffix}').exists()
 
@@ -380,3 +753,54 @@ int main(void) {
     # should still work after we relocate the prefix
     prefix.rename(newprefix)
     assert subprocess.check_output(newmain) == b'hello from 9001\n'
+
+
+def test_relink_integration_transitive(tmp_path):
+    shared_suffix = 'dylib' if sys.platform == 'darwin' else 'so'
+
+    homebrew_dir = tmp_path.joinpath('homebrew')
+    lib = homebrew_dir.joinpath('lib')
+    lib.mkdir(parents=True)
+    libinner = lib.joinpath(f'libinner.{shared_suffix}')
+    libouter = lib.joinpath(f'libouter.{shared_suffix}')
+
+    src_dir = tmp_path.joinpath('src')
+    src_dir.mkdir(parents=True)
+    inner_c = src_dir.joinpath('inner.c')
+    inner_c.write_text('int inner(void) { return 9001; }\n')
+    outer_c = src_dir.joinpath('outer.c')
+    outer_c.write_text(
+        'int inner(void);\n'
+        'int outer(void) { return inner() + 1; }\n',
+    )
+    main_c = src_dir.joinpath('main.c')
+    main_c.write_text(
+        '#include <stdio.h>\n'
+        'int outer(void);\n'
+        'int main(void) { printf("hello from %d\\n", outer()); }\n',
+    )
+
+    prefix = tmp_path.joinpath('prefix')
+    prefix_lib = prefix.joinpath('lib')
+    prefix_lib.mkdir(parents=True)
+    main = prefix.joinpath('main')
+
+    with mock.patch.dict(os.environ, {'LD_LIBRARY_PATH': str(lib)}):
+        subprocess.check_call(('gcc', '-shared', '-o', libinner, inner_c))
+        subprocess.check_call((
+            'gcc', '-shared', '-o', libouter, outer_c, f'-L{lib}', '-linner',
+        ))
+        subprocess.check_call((
+            'gcc', '-o', main, main_c, f'-L{lib}', '-louter',
+        ))
+
+        assert subprocess.check_output(main) == b'hello from 9002\n'
+
+        build_binary._relink_all([str(main)], str(prefix_lib))
+
+    assert prefix_lib.joinpath(f'libouter.{shared_suffix}').exists()
+    assert prefix_lib.joinpath(f'libinner.{shared_suffix}').exists()
+
+    # should still work after we remove the original libs
+    shutil.rmtree(homebrew_dir)
+    assert subprocess.check_output(main) == b'hello from 9002\n'
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
+import hashlib
 import os.path
 import subprocess
 import tempfile
+from typing import IO
 
 MODULES = (
     '_elementtree',
@@ -40,6 +43,59 @@ def test_curses_is_wide(py: str) -> None:
     subprocess.check_call((py, '-c', 'import curses;curses.window.get_wch'))
 
 
+DECOMPRESS = {'.tar.zst': ('zstd', '-dc'), '.tgz': ('gzip', '-dc')}
+
+
+def _archive_ext(filename: str) -> str:
+    for ext in DECOMPRESS:
+        if filename.endswith(ext):
+            return ext
+    raise SystemExit(f'unexpected archive: {filename}')
+
+
+def _tar_sha256(filename: str, *, extract_to: str | None = None) -> str:
+    cmd = (*DECOMPRESS[_archive_ext(filename)], filename)
+    decompress = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    assert decompress.stdout is not None
+    procs = [decompress]
+
+    # older tars (such as debian buster's) don't understand zstd
+    # so decompress ourselves and hand tar the uncompressed stream
+    tar_in: IO[bytes] | None = None
+    if extract_to is not None:
+        tar = subprocess.Popen(
+            ('tar', '-C', extract_to, '-xf', '-'),
+            stdin=subprocess.PIPE,
+        )
+        procs.append(tar)
+        tar_in = tar.stdin
+
+    checksum = hashlib.sha256()
+    try:
+        bts = decompress.stdout.read(256 * 1024)
+        while bts:
+            checksum.update(bts)
+            if tar_in is not None:
+                tar_in.write(bts)
+            bts = decompress.stdout.read(256 * 1024)
+        if tar_in is not None:
+            tar_in.close()
+    except BrokenPipeError:
+        assert tar_in is not None
+        with contextlib.suppress(BrokenPipeError):
+            tar_in.close()  # the flush of what's left fails too
+    decompress.stdout.close()  # so the decompressor sees SIGPIPE if we bail
+
+    for proc in procs:
+        proc.wait()
+    # tar first: its failure is the cause when the decompressor dies
+    for proc in reversed(procs):
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+    return checksum.hexdigest()
+
+
 def main() -> int:
     parser = argparse.ArgumentParser()
     parser.add_argument('--dist-dir', default='dist')
@@ -49,19 +105,29 @@ def main() -> int:
         print('SKIP: no file to validate')
         return 0
 
-    filename, = os.listdir(args.dist_dir)
-    filename = os.path.join(args.dist_dir, filename)
-
-    with tempfile.TemporaryDirectory() as tmpdir:
-        subprocess.check_call(('tar', '-C', tmpdir, '-xf', filename))
-        rootdir, = os.listdir(tmpdir)
-        py = os.path.join(tmpdir, rootdir, 'bin', 'python3')
-
-        tests = [(k, v) for k, v in globals().items() if k.startswith('test_')]
-        for k, test in tests:
-            print(f'{k}...', end='', flush=True)
-            test(py)
-            print('PASSED')
+    tests = [(k, v) for k, v in globals().items() if k.startswith('test_')]
+    # the .tgz and .tar.zst of a build hold the same tar: only test it once
+    validated: dict[str, str] = {}
+    for filename in sorted(os.listdir(args.dist_dir)):
+        name = filename[:-len(_archive_ext(filename))]
+        filename = os.path.join(args.dist_dir, filename)
+        print(f'=== {filename}')
+
+        if name in validated:
+            if _tar_sha256(filename) != validated[name]:
+                raise SystemExit(f'{filename}: differs from {name} archive')
+            print('same contents as already validated archive')
+            continue
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            validated[name] = _tar_sha256(filename, extract_to=tmpdir)
+            rootdir, = os.listdir(tmpdir)
+            py = os.path.join(tmpdir, rootdir, 'bin', 'python3')
+
+            for k, test in tests:
+                print(f'{k}...', end='', flush=True)
+                test(py)
+                print('PASSED')
 
     return 0
 